@@ -10,59 +10,506 @@ IMPORTANT: This version leverages Omarchy's browser abstraction layer
 by ONLY modifying user configs, preserving upgrade compatibility.
 """
 
+import argparse
+import concurrent.futures
+import fcntl
+import functools
+import hashlib
+import http.client
 import os
 import re
+import shlex
 import shutil
 import subprocess
 import sys
+import threading
+import urllib.parse
 import json
 from pathlib import Path
 
-def run_command(command, check=False, shell=True):
-    """Run a shell command with error handling and show output in terminal"""
-    try:
-        # Always source bash functions, escape double quotes in command
-        command_escaped = command.replace('"', r"\"")
-        command = f'bash -c "source ~/.local/share/omarchy/default/bash/functions && {command_escaped}"'
+# Package changes are queued by remove_packages(), manage_font_packages() and
+# prepare_keyd() and applied by apply_package_changes(), so yay only pays its
+# startup and dependency-resolution cost once per direction instead of once
+# per package.
+PKGS_TO_REMOVE = []
+PKGS_TO_INSTALL = []
+
+# Set whenever this run adds, rewrites or removes a .desktop file in
+# ~/.local/share/applications, so update_desktop_database() can skip no-ops
+_desktop_dirty = False
+
+# Directories ensure_dir() has already created or found this run
+_ensured_dirs = set()
+
+# Every PNG file starts with this; a downloaded "icon" without it is an error
+# page or similar, not something to install
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Output buffer of the run_concurrently() step running on this thread, if any
+_step_output = threading.local()
+
+# The user's home directory and the parts of it most steps work in,
+# resolved once rather than in every step
+HOME = Path.home()
+CONFIG_DIR = HOME / ".config"
+LOCAL_SHARE = HOME / ".local/share"
+USER_APPS = LOCAL_SHARE / "applications"
+OMARCHY_BIN = LOCAL_SHARE / "omarchy/bin"
+
+# Written after a fully successful run; holds the hash of the script that ran
+STATE_FILE = HOME / ".local/state/omarchy/customize.done"
+
+# stat() fingerprint of toshy_config.py as last left customized by us
+TOSHY_STAMP_FILE = STATE_FILE.with_name("toshy_config.stamp")
+
+# Flags that make Google Chrome run on native Wayland (see configure_chrome_wayland)
+CHROME_WAYLAND_FLAGS = (
+    "--ozone-platform=wayland",
+    "--ozone-platform-hint=wayland",
+    "--enable-features=TouchpadOverscrollHistoryNavigation",
+)
+CHROME_FLAGS_CONF = "".join(f"{flag}\n" for flag in CHROME_WAYLAND_FLAGS)
+
+# ioctl request that clones a file's extents copy-on-write (FICLONE, linux/fs.h)
+_FICLONE = 0x40049409
+
+# Nautilus script installed by create_nautilus_vscode_script(), encoded once
+NAUTILUS_VSCODE_SCRIPT = """#!/bin/bash
+
+# Nautilus script to open selected files/directories in VS Code or Cursor
+
+# Check which editor command is available (prefer code over cursor)
+EDITOR_CMD=""
+if command -v code &> /dev/null; then
+    EDITOR_CMD="code"
+elif command -v cursor &> /dev/null; then
+    EDITOR_CMD="cursor"
+else
+    zenity --error --text="Neither VS Code (code) nor Cursor (cursor) command found. Please make sure at least one is installed and accessible from the command line."
+    exit 1
+fi
+
+# Strip file:// and percent-decode a URI in-process (no sed/python3 per file)
+urldecode() {
+    local u="${1#file://}"
+    printf '%b' "${u//%/\\\\x}"
+}
+
+# Get selected files from Nautilus
+# Nautilus provides selected files through environment variables
+IFS=$'\\n'
+if [ -n "$NAUTILUS_SCRIPT_SELECTED_FILE_PATHS" ]; then
+    # Use the file paths provided by Nautilus
+    selected_files=($(echo "$NAUTILUS_SCRIPT_SELECTED_FILE_PATHS"))
+elif [ -n "$NAUTILUS_SCRIPT_SELECTED_URIS" ]; then
+    # Convert URIs to file paths if needed
+    selected_files=()
+    for uri in $(echo "$NAUTILUS_SCRIPT_SELECTED_URIS"); do
+        # Remove file:// prefix and decode URI
+        file_path=$(urldecode "$uri")
+        selected_files+=("$file_path")
+    done
+else
+    zenity --error --text="No files selected."
+    exit 1
+fi
+
+# Open each selected file/directory in the available editor
+for file in "${selected_files[@]}"; do
+    if [ -e "$file" ]; then
+        $EDITOR_CMD "$file" &
+    fi
+done
+
+# Disown the background processes so they don't get killed when script exits
+disown
+""".encode()
+
+# Whitespace around "=" and "," in config lines (see normalize_config_line)
+_CONFIG_SPACING_RE = re.compile(r"\s*([=,])\s*")
+
+# The single-line header comment customize_waybar() writes above the JSON
+_LEADING_LINE_COMMENT_RE = re.compile(r"\A\s*//[^\n]*\n")
+
+# JSONC tokens for parse_jsonc_to_json(): string literals (kept verbatim, so
+# "//" inside URLs survives), line and block comments, and a trailing comma
+# before } or ] (possibly with comments in between). Every alternative starts
+# with a distinct character, so one left-to-right scan handles them all.
+_JSONC_TOKEN_RE = re.compile(
+    r'"(?:\\.|[^"\\])*"'
+    r"|//[^\n]*"
+    r"|/\*[\s\S]*?\*/"
+    r"|,(?:\s|//[^\n]*|/\*[\s\S]*?\*/)*([}\]])"
+)
+
+
+# keyd configuration installed by install_and_configure_keyd(); kept as bytes
+# since it is only compared with the installed file and piped to sudo
+KEYD_CONFIG_PATH = Path("/etc/keyd/default.conf")
+KEYD_BACKUP_PATH = Path("/etc/keyd/default.conf.original")
+KEYD_CONFIG = """# === START OMARCHY CUSTOMIZATION ===
+# OMARCHY: Mac-like keyboard behavior configuration
+# This file can be reverted by restoring from /etc/keyd/default.conf.original
+
+# Apply to every keyboard
+[ids]
+*
+
+# ----  MAIN LAYER  -------------------------------------------------
+[main]
+# Map physical Alt to a custom layer that acts like Control but with special arrow behavior
+leftalt = layer(mac_control)
+leftcontrol = layer(alt)
+rightalt = layer(mac_control)  
+rightcontrol = layer(alt)
+
+# ----  MAC_CONTROL LAYER (acts like Control but with Mac-style arrows) ----
+[mac_control:C]
+left = home
+right = end
+
+# ----  ALT LAYER (physical Ctrl now acts as Alt) ----
+[alt:A]
+# Exception: preserve Ctrl+C for terminal interrupt
+c = C-c
+
+# === END OMARCHY CUSTOMIZATION ===
+""".encode()
+
+# Every directory this script leaves .original backups in. restore.py imports
+# this to tell whether there is anything to restore before walking ~/.config,
+# so backup_file_before_edit() refuses paths outside it
+BACKUP_DIRS = (
+    HOME,
+    CONFIG_DIR / "hypr",
+    CONFIG_DIR / "alacritty",
+    CONFIG_DIR / "ghostty",
+    CONFIG_DIR / "mako",
+    CONFIG_DIR / "waybar",
+    CONFIG_DIR / "toshy",
+    KEYD_BACKUP_PATH.parent,
+)
+
+# Literal anchors in Toshy's stock toshy_config.py that
+# configure_toshy_keyboard_layout() edits around. Bytes, like everything the
+# edit touches, since the config is edited without decoding it
+TOSHY_CUSTOMIZED_MARKER = b"OMARCHY CUSTOMIZATION: Override keyboard type"
+TOSHY_SETTINGS_MARKER = b"cnfg.watch_shared_devices()     # Look for network KVM apps and watch logs (on server only)"
+TOSHY_SLICE_START = b"###  SLICE_MARK_START: user_custom_modmaps  ###"
+TOSHY_SLICE_END = b"###  SLICE_MARK_END: user_custom_modmaps  ###"
+# Inserted after TOSHY_SETTINGS_MARKER to disable Toshy's built-in modmaps
+TOSHY_OVERRIDE_CONFIG = """
+        # === START OMARCHY CUSTOMIZATION: Override keyboard type ===
+        cnfg.override_kbtype = 'IBM'     # Use IBM type to avoid Windows/Mac/Chromebook built-in modmaps
+        # === END OMARCHY CUSTOMIZATION: Override keyboard type ===""".encode()
+# Inserted between the user_custom_modmaps slice marks
+TOSHY_CUSTOM_MODMAPS = """# === START OMARCHY CUSTOMIZATION: Custom modmaps ===
+modmap("OMARCHY custom layout: Cmd→Ctrl, Ctrl→Alt, keep Super - GUI", {
+    # Left-hand modifiers
+    Key.LEFT_ALT:  Key.LEFT_CTRL,   # Alt (Cmd) → Ctrl
+    Key.LEFT_CTRL: Key.LEFT_ALT,    # Ctrl      → Alt
+    Key.LEFT_META: Key.LEFT_META,   # Win/Super stays Super
+
+    # Right-hand modifiers (optional)
+    Key.RIGHT_ALT:  Key.RIGHT_CTRL,
+    Key.RIGHT_CTRL: Key.RIGHT_ALT,
+    Key.RIGHT_META: Key.RIGHT_META,
+}, when = lambda ctx:
+    not matchProps(clas=termStr)(ctx)
+)
+
+modmap("OMARCHY custom layout: Terminals - preserve Ctrl/Alt, keep Super", {
+    # In terminals: keep normal Ctrl/Alt behavior but preserve Super
+    Key.LEFT_ALT:  Key.LEFT_ALT,    # Alt stays Alt
+    Key.LEFT_CTRL: Key.LEFT_CTRL,   # Ctrl stays Ctrl  
+    Key.LEFT_META: Key.LEFT_META,   # Win/Super stays Super
+
+    # Right-hand modifiers
+    Key.RIGHT_ALT:  Key.RIGHT_ALT,
+    Key.RIGHT_CTRL: Key.RIGHT_CTRL,
+    Key.RIGHT_META: Key.RIGHT_META,
+}, when = lambda ctx:
+    matchProps(clas=termStr)(ctx)
+)
+# === END OMARCHY CUSTOMIZATION: Custom modmaps ===""".encode()
+# Emacs-style Super key mappings that interfere with Hyprland
+TOSHY_EMACS_MAPPINGS = (
+    b'C("Super-a"):               C("Home"),                      # Beginning of Line',
+    b'C("Super-e"):               C("End"),                       # End of Line',
+    b'C("Super-b"):               C("Left"),',
+    b'C("Super-f"):               C("Right"),',
+    b'C("Super-n"):               C("Down"),',
+    b'C("Super-p"):               C("Up"),',
+    b'C("Super-k"):              [C("Shift-End"), C("Backspace")],',
+    b'C("Super-d"):               C("Delete"),',
+)
+# All of the above (plus modmap calls) as one alternation, so the config is
+# scanned once rather than once per anchor
+_TOSHY_ANCHORS_RE = re.compile(
+    b"|".join(
+        re.escape(anchor)
+        for anchor in (
+            TOSHY_CUSTOMIZED_MARKER,
+            TOSHY_SETTINGS_MARKER,
+            TOSHY_SLICE_START,
+            TOSHY_SLICE_END,
+            b"modmap(",
+            *(b"    " + mapping for mapping in TOSHY_EMACS_MAPPINGS),
+        )
+    )
+)
 
-        result = subprocess.run(command, shell=shell, check=check)
+
+def run_command(argv, check=False, quiet=False, input=None):
+    """Run a command given as an argv list and show output in terminal
+
+    The command is exec'd directly. Sourcing Omarchy's bash functions first
+    bought nothing: every command here is a binary or a standalone script,
+    and bash functions aren't inherited by child processes.
+
+    With quiet=True the command's stdout/stderr go to /dev/null, for calls
+    where only the exit status matters and failure is an expected outcome.
+    Inside a run_concurrently() step they are captured into the step's
+    output instead. input (bytes) is fed to the command's stdin.
+    """
+    captured = not quiet and getattr(_step_output, "buffer", None) is not None
+    if quiet:
+        stdout = stderr = subprocess.DEVNULL
+    elif captured:
+        stdout, stderr = subprocess.PIPE, subprocess.STDOUT
+    else:
+        stdout = stderr = None
+    try:
+        result = subprocess.run(
+            argv, check=check, stdout=stdout, stderr=stderr, input=input
+        )
+        if captured and result.stdout:
+            print(result.stdout.decode(errors="replace"), end="")
         return result.returncode == 0
-    except subprocess.CalledProcessError:
+    except subprocess.CalledProcessError as e:
+        if captured and e.output:
+            print(e.output.decode(errors="replace"), end="")
+        return False
+    except OSError as e:
+        print(f"! Could not run {argv[0]}: {e}")
         return False
 
 
-def backup_file_before_edit(file_path):
-    """Create a .original backup of a file before editing it"""
-    file_path = Path(file_path)
+@functools.lru_cache(maxsize=None)
+def have(cmd):
+    """Return whether cmd is on PATH, walking PATH only once per command"""
+    return shutil.which(cmd) is not None
 
-    if not file_path.exists():
-        print(f"- File {file_path} doesn't exist, no backup needed")
+
+def scan_dir(path):
+    """Map entry names to os.DirEntry objects for path from a single scandir pass
+
+    Missing or unreadable directories yield an empty dict.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry for entry in entries}
+    except OSError:
+        return {}
+
+
+def ensure_dir(path):
+    """Create path and any missing parents, at most once per directory per run"""
+    path = Path(path)
+    if path not in _ensured_dirs:
+        path.mkdir(parents=True, exist_ok=True)
+        _ensured_dirs.add(path)
+
+
+class _StepAwareStdout:
+    """sys.stdout stand-in that sends a concurrent step's prints to its buffer
+
+    Each worker thread has its own buffer, unlike contextlib.redirect_stdout,
+    which swaps the one process-wide stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = getattr(_step_output, "buffer", None)
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _run_buffered(step):
+    """Run step with its output captured, returning (result, error, output)"""
+    _step_output.buffer = buffer = []
+    try:
+        return step(), None, buffer
+    except Exception as e:
+        return None, e, buffer
+    finally:
+        _step_output.buffer = None
+
+
+def is_png(path):
+    """Whether path exists and starts with the PNG signature"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_PNG_SIGNATURE)) == _PNG_SIGNATURE
+    except OSError:
         return False
 
+
+def spaced(step):
+    """Wrap a main() step so its output ends with the usual blank line"""
+
+    def run():
+        result = step()
+        print()
+        return result
+
+    return run
+
+
+def run_concurrently(*steps):
+    """Run independent steps on a thread pool and return their results in order
+
+    The steps mostly wait on child processes (which releases the GIL), so the
+    waits overlap and wall time drops to roughly the slowest step. Each step's
+    output, including that of commands it runs, is buffered and printed in
+    step order once all are done, so steps must not prompt for input.
+    """
+    outermost = not isinstance(sys.stdout, _StepAwareStdout)
+    if outermost:
+        sys.stdout = _StepAwareStdout(sys.stdout)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            outcomes = list(executor.map(_run_buffered, steps))
+    finally:
+        if outermost:
+            sys.stdout = sys.stdout.stream
+
+    # Nested inside another step, this lands in that step's buffer
+    for _, _, output in outcomes:
+        sys.stdout.write("".join(output))
+    for _, error, _ in outcomes:
+        if error is not None:
+            raise error
+    return [result for result, _, _ in outcomes]
+
+
+def clone_file(src, dst):
+    """Copy src to dst (with metadata, like shutil.copy2) as a reflink if possible
+
+    On copy-on-write filesystems such as btrfs, Omarchy's default, FICLONE
+    makes dst share src's extents: no data is copied, yet dst is still an
+    independent file, unlike a hardlink, which any in-place edit of src would
+    also change. Elsewhere this falls back to a regular byte copy.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dst)
+
+
+def backup_file_before_edit(file_path):
+    """Create a .original backup of a file before editing it"""
+    file_path = Path(file_path)
     backup_path = file_path.with_suffix(file_path.suffix + ".original")
+    assert file_path.parent in BACKUP_DIRS, f"add {file_path.parent} to BACKUP_DIRS"
 
     # Don't overwrite existing backup
     if backup_path.exists():
         print(f"- Backup {backup_path} already exists, skipping")
         return True
 
+    # Let the copy discover a missing source instead of stat-ing it first
     try:
-        shutil.copy2(file_path, backup_path)
+        clone_file(file_path, backup_path)
         print(f"✓ Created backup: {backup_path}")
         return True
+    except FileNotFoundError:
+        print(f"- File {file_path} doesn't exist, no backup needed")
+        return False
     except Exception as e:
         print(f"! Failed to create backup of {file_path}: {e}")
         return False
 
 
+def atomic_write_bytes(file_path, data):
+    """Replace file_path's content via a sibling temp file and os.replace
+
+    rename(2) is atomic, so the file is always either the old or the new
+    version even if the run is interrupted. Symlinks are resolved first so a
+    linked dotfile is updated rather than replaced, and the mode is kept.
+    """
+    target = Path(os.path.realpath(file_path))
+    tmp_path = target.with_name(target.name + ".tmp")
+
+    try:
+        mode = target.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_text(file_path, content):
+    """Atomically replace file_path's content with UTF-8 text"""
+    atomic_write_bytes(file_path, content.encode())
+
+
+def write_if_changed(file_path, content):
+    """Write content to file_path unless it already holds exactly that text
+
+    Returns True if the file was written.
+    """
+    file_path = Path(file_path)
+    data = content.encode()
+
+    try:
+        if file_path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+
+    atomic_write_bytes(file_path, data)
+    return True
+
+
+def normalize_config_line(line):
+    """Normalize spacing so `bind=A,B` and `bind = A, B` compare equal"""
+    return _CONFIG_SPACING_RE.sub(r"\1", " ".join(line.split()))
+
+
 def add_fenced_content_to_file(
-    file_path, content_lines, fence_label="OMARCHY CUSTOMIZATION"
+    file_path,
+    content_lines,
+    fence_label="OMARCHY CUSTOMIZATION",
+    skip_present_lines=False,
 ):
-    """Add content to file with clear fencing markers for easy reversal"""
+    """Add content to file with clear fencing markers for easy reversal
+
+    With skip_present_lines, `key = value` directives the file already
+    contains (ignoring spacing) are left out of the fenced block. Structural
+    lines such as `misc {` and `}` are always kept so blocks stay balanced.
+    """
     file_path = Path(file_path)
 
     # Use CSS comment syntax for .css files, otherwise use shell/config syntax
-    if str(file_path).endswith('.css'):
+    if file_path.suffix == ".css":
         start_fence = f"/* === START {fence_label} === */"
         end_fence = f"/* === END {fence_label} === */"
     else:
@@ -70,9 +517,9 @@ def add_fenced_content_to_file(
         end_fence = f"# === END {fence_label} ==="
 
     try:
-        if file_path.exists():
+        try:
             current_content = file_path.read_text()
-        else:
+        except FileNotFoundError:
             current_content = ""
 
         # Check if our fenced section already exists
@@ -80,15 +527,26 @@ def add_fenced_content_to_file(
             print(f"- Fenced section '{fence_label}' already exists in {file_path}")
             return True
 
+        if skip_present_lines:
+            present = {
+                normalize_config_line(line) for line in current_content.splitlines()
+            }
+            content_lines = [
+                line
+                for line in content_lines
+                if "=" not in line or normalize_config_line(line) not in present
+            ]
+            if not any(line.strip() for line in content_lines):
+                print(f"- All '{fence_label}' lines already present in {file_path}")
+                return True
+
         # Create the fenced content
-        fenced_content = f"\n{start_fence}\n"
-        for line in content_lines:
-            fenced_content += f"{line}\n"
-        fenced_content += f"{end_fence}\n"
+        body = "\n".join(content_lines)
+        fenced_content = f"\n{start_fence}\n{body}\n{end_fence}\n"
 
-        # Append to file
-        with open(file_path, "a") as f:
-            f.write(fenced_content)
+        # Rewrite atomically rather than appending in place, so an interrupted
+        # run can't leave a half-written fence behind
+        atomic_write_text(file_path, current_content + fenced_content)
 
         print(f"✓ Added fenced content to {file_path}")
         return True
@@ -100,24 +558,65 @@ def add_fenced_content_to_file(
 
 def parse_jsonc_to_json(jsonc_text):
     """Best-effort conversion of JSONC (comments, trailing commas) to valid JSON string"""
-    # Remove block comments
-    without_block = re.sub(r"/\*[\s\S]*?\*/", "", jsonc_text)
-    # Remove line comments (naive, may affect comment-like content in strings)
-    without_line = re.sub(r"(?m)//.*$", "", without_block)
-    # Remove trailing commas before } or ]
-    without_trailing_commas = re.sub(r",\s*([}\]])", r"\1", without_line)
-    return without_trailing_commas
+
+    def replace(match):
+        token = match.group()
+        if token.startswith('"'):
+            return token
+        # Trailing comma: keep only the closing bracket; comments become ""
+        return match.group(1) or ""
+
+    return _JSONC_TOKEN_RE.sub(replace, jsonc_text)
+
+
+def command_output(argv):
+    """Run argv directly and return its stdout, or None if it fails"""
+    try:
+        # stderr is never inspected, so don't pipe and buffer it
+        result = subprocess.run(
+            argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def installed_packages():
+    """Return the names of all installed packages from a single pacman -Qq call
+
+    Returns None if pacman fails, so callers can't mistake a failed listing
+    for a system with nothing installed.
+    """
+    output = command_output(["pacman", "-Qq"])
+    return None if output is None else set(output.split())
 
 
 def remove_packages_individually(packages, action_description="packages"):
-    """Remove packages individually so failure of one doesn't prevent removal of others"""
-    print(f"Removing {action_description}...")
+    """Remove packages in one yay call, retrying one by one if that fails
+
+    A single package that can't be removed (e.g. still required by something
+    else) fails the whole transaction. The fallback retries only the packages
+    still installed, so failure of one doesn't prevent removal of others.
+    """
+    print(f"Removing {action_description}: {', '.join(packages)}...")
+
+    if run_command(["yay", "-Rns", "--noconfirm", *packages]):
+        print(f"✓ {len(packages)} {action_description} removed successfully")
+        return len(packages), []
 
-    removed_count = 0
+    print("! Batch removal failed, retrying packages individually")
+    installed = installed_packages()
+    # Without a listing, nothing can be assumed removed; retry every package
+    if installed is None:
+        remaining = list(packages)
+    else:
+        remaining = [p for p in packages if p in installed]
+
+    removed_count = len(packages) - len(remaining)
     failed_packages = []
 
-    for package in packages:
-        success = run_command(f"yay -Rns --noconfirm {package}")
+    for package in remaining:
+        success = run_command(["yay", "-Rns", "--noconfirm", package])
         if success:
             print(f"✓ {package} removed successfully")
             removed_count += 1
@@ -137,50 +636,17 @@ def remove_packages_individually(packages, action_description="packages"):
 
 
 def remove_packages():
-    """Remove chromium and neovim packages, install Google Chrome"""
-    print("Removing chromium and installing Google Chrome...")
-
-    # Remove chromium
-    success = run_command("yay -Rns --noconfirm chromium")
-    if success:
-        print("✓ Chromium removed successfully")
-    else:
-        print("! Chromium removal failed or was already removed")
-
-    # Install Google Chrome
-    success = run_command("yay -S --noconfirm --needed google-chrome")
-    if success:
-        print("✓ Google Chrome installed successfully")
-    else:
-        print("! Google Chrome installation failed")
-
-    remove_packages_individually(
-        ["nvim", "luarocks", "tree-sitter-cli"], "neovim and related packages"
-    )
-
-    print("Installing nano as replacement editor...")
-    success = run_command("yay -S --noconfirm --needed nano")
-    if success:
-        print("✓ nano installed successfully")
-    else:
-        print("! nano installation failed")
-
-    print("Installing bash-completion...")
-    success = run_command("yay -S --noconfirm --needed bash-completion")
-    if success:
-        print("✓ bash-completion installed successfully")
-    else:
-        print("! bash-completion installation failed")
-
-    print("Installing Joplin...")
-    success = run_command("yay -S --noconfirm --needed joplin-appimage")
-    if success:
-        print("✓ Joplin installed successfully")
-    else:
-        print("! Joplin installation failed")
+    """Queue removal of chromium and neovim, and installation of Google Chrome"""
+    print("Queueing Chromium → Google Chrome and neovim → nano package changes...")
 
-    remove_packages_individually(
+    PKGS_TO_REMOVE.extend(
         [
+            "chromium",
+            # neovim and related packages
+            "nvim",
+            "luarocks",
+            "tree-sitter-cli",
+            # additional unwanted packages
             "mariadb-libs",
             "cargo",
             "clang",
@@ -193,12 +659,7 @@ def remove_packages():
             # "gcc-libs",
             "gcc14",
             "wl-clip-persist",
-        ],
-        "additional unwanted packages",
-    )
-
-    remove_packages_individually(
-        [
+            # zoom, obsidian, signal, dropbox, 1password, and localsend
             "zoom",
             "obsidian",
             "obsidian-bin",
@@ -207,72 +668,145 @@ def remove_packages():
             "1password-beta",
             "1password-cli",
             "localsend-bin",
-        ],
-        "zoom, obsidian, signal, dropbox, 1password, and localsend",
+        ]
+    )
+
+    PKGS_TO_INSTALL.extend(
+        ["google-chrome", "nano", "bash-completion", "joplin-appimage"]
     )
 
 
 def manage_font_packages():
-    """Manage font packages according to fork preferences"""
-    print("Managing font packages...")
+    """Queue font package changes according to fork preferences"""
+    print("Queueing font package changes...")
 
     # Remove unwanted CJK and extra fonts
-    remove_packages_individually(
-        ["noto-fonts-cjk", "noto-fonts-extra"], "unwanted font packages"
-    )
+    PKGS_TO_REMOVE.extend(["noto-fonts-cjk", "noto-fonts-extra"])
 
     # Install ttf-liberation for Hebrew support
-    print("Installing ttf-liberation for Hebrew support...")
-    success = run_command("yay -S --noconfirm --needed ttf-liberation")
-    if success:
-        print("✓ ttf-liberation installed successfully")
-    else:
-        print("! ttf-liberation installation failed")
+    PKGS_TO_INSTALL.append("ttf-liberation")
+
+
+def apply_package_changes():
+    """Apply the queued removals and installs with one yay call each
+
+    Returns True if every queued package ended up removed or installed.
+    """
+    print("Applying package changes...")
+    success = True
+
+    installed = installed_packages()
+    if installed is None:
+        # Removing unfiltered would fail on every absent package; installing
+        # unfiltered is safe, as --needed skips what's already there
+        print("! Could not list installed packages, skipping package removals")
+        if PKGS_TO_INSTALL:
+            print(f"Installing {', '.join(PKGS_TO_INSTALL)}...")
+            run_command(["yay", "-S", "--noconfirm", "--needed", *PKGS_TO_INSTALL])
+            have.cache_clear()
+        return False
+
+    to_remove = [p for p in PKGS_TO_REMOVE if p in installed]
+    absent = [p for p in PKGS_TO_REMOVE if p not in installed]
+
+    if absent:
+        print(
+            f"- {len(absent)} packages were not found or already removed: {', '.join(absent)}"
+        )
+
+    if to_remove:
+        _, failed = remove_packages_individually(to_remove)
+        success = not failed
+
+        # -Rns may also have dropped dependencies, so re-snapshot
+        installed = installed_packages()
+        if installed is None:
+            print("! Could not list installed packages after removal")
+            installed = set()
+            success = False
+
+    # Skip yay entirely when everything is already installed (the common
+    # case on re-runs); --needed still guards the packages that remain
+    to_install = [p for p in PKGS_TO_INSTALL if p not in installed]
+    present = [p for p in PKGS_TO_INSTALL if p in installed]
+
+    if present:
+        print(f"- {len(present)} packages already installed: {', '.join(present)}")
+
+    if to_install:
+        print(f"Installing {', '.join(to_install)}...")
+        run_command(["yay", "-S", "--noconfirm", "--needed", *to_install])
+
+        # yay can install some targets (e.g. repo packages) and still fail on
+        # others (e.g. an AUR build), so report per package from one snapshot
+        installed = installed_packages() or set()
+        for package in to_install:
+            if package in installed:
+                print(f"✓ {package} installed successfully")
+            else:
+                print(f"! {package} installation failed")
+                success = False
+
+        # Newly installed packages may have added commands to PATH
+        have.cache_clear()
+
+    return success
+
+
+def remove_trees(paths):
+    """Delete directory trees with one rm -rf, falling back to shutil.rmtree
+
+    Returns True if every tree is gone afterwards.
+    """
+    # rm walks large trees (e.g. nvim plugin checkouts) much faster than
+    # shutil.rmtree's per-entry Python calls
+    if not (have("rm") and run_command(["rm", "-rf", "--", *paths])):
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    all_removed = True
+    for path in paths:
+        if os.path.lexists(path):
+            print(f"! Failed to remove {path}")
+            all_removed = False
+        else:
+            print(f"✓ Removed {path}")
+    return all_removed
 
 
 def remove_user_config_directories():
     """Remove user configuration directories for uninstalled applications"""
     print("Removing user configuration directories...")
 
-    home = Path.home()
-
-    # Remove neovim configurations
-    nvim_dirs = [
-        home / ".config/nvim",
-        home / ".local/share/nvim",
-        home / ".local/state/nvim",
-        home / ".cache/nvim",
-    ]
-
-    for nvim_dir in nvim_dirs:
-        if nvim_dir.exists():
-            shutil.rmtree(nvim_dir)
-            print(f"✓ Removed {nvim_dir}")
-
-    # Remove 1Password configurations
-    password_dirs = [
-        home / ".config/1Password",
-        home / ".local/share/1Password",
-        home / ".cache/1Password",
-        home / ".ssh/1Password",
-    ]
+    # neovim, 1Password and mise directories, grouped by parent so each
+    # parent is listed once instead of stat-ing every candidate path
+    targets = {
+        CONFIG_DIR: ["nvim", "1Password", "mise"],
+        LOCAL_SHARE: ["nvim", "1Password", "mise"],
+        HOME / ".local/state": ["nvim"],
+        HOME / ".cache": ["nvim", "1Password", "mise"],
+        HOME / ".ssh": ["1Password"],
+    }
 
-    for password_dir in password_dirs:
-        if password_dir.exists():
-            shutil.rmtree(password_dir)
-            print(f"✓ Removed {password_dir}")
+    dirs_to_remove = []
+    for parent, names in targets.items():
+        present = scan_dir(parent)
+        for name in names:
+            entry = present.get(name)
+            if entry is None:
+                continue
+            # DirEntry caches the d_type from the listing, so this costs no
+            # extra stat; symlinks and stray files are left alone
+            if not entry.is_dir(follow_symlinks=False):
+                print(f"- Skipping {entry.path} (not a directory)")
+                continue
+            dirs_to_remove.append(entry.path)
 
-    # Remove mise configurations
-    mise_dirs = [
-        home / ".config/mise",
-        home / ".local/share/mise",
-        home / ".cache/mise",
-    ]
+    if not dirs_to_remove:
+        print("- No configuration directories to remove")
+        return
 
-    for mise_dir in mise_dirs:
-        if mise_dir.exists():
-            shutil.rmtree(mise_dir)
-            print(f"✓ Removed {mise_dir}")
+    remove_trees(dirs_to_remove)
 
 
 def remove_broken_mise_shims():
@@ -290,7 +824,7 @@ def remove_broken_mise_shims():
     """
     print("Removing broken mise-dependent shims from ~/.local/bin/...")
 
-    local_bin = Path.home() / ".local/bin"
+    local_bin = HOME / ".local/bin"
     if not local_bin.is_dir():
         print("- ~/.local/bin not found, skipping")
         return
@@ -324,73 +858,60 @@ def remove_system_asdcontrol():
     """
     print("Removing system asdcontrol components...")
 
-    # Remove asdcontrol binary (installed by 'sudo make install')
-    asdcontrol_bin = Path("/usr/local/bin/asdcontrol")
-    if asdcontrol_bin.exists():
-        success = run_command("sudo rm -f /usr/local/bin/asdcontrol")
-        if success:
-            print("✓ Removed asdcontrol binary")
-        else:
-            print("! Failed to remove asdcontrol binary")
-    else:
-        print("- asdcontrol binary not found")
-
-    # Remove Omarchy's custom sudoers file (not part of official asdcontrol)
-    # Official asdcontrol uses udev rules instead of sudoers for permissions
-    try:
-        sudoers_file = Path("/etc/sudoers.d/asdcontrol")
-        if sudoers_file.exists():
-            success = run_command("sudo rm -f /etc/sudoers.d/asdcontrol")
-            if success:
-                print("✓ Removed Omarchy's asdcontrol sudoers file")
-            else:
-                print("! Failed to remove asdcontrol sudoers file")
-        else:
-            print("- asdcontrol sudoers file not found")
-    except PermissionError:
-        # Can't check if file exists due to permissions, try to remove anyway
-        print("- Cannot check asdcontrol sudoers file existence, attempting removal...")
-        success = run_command("sudo rm -f /etc/sudoers.d/asdcontrol")
-        if success:
-            print("✓ Removed Omarchy's asdcontrol sudoers file (if it existed)")
-        else:
-            print("- asdcontrol sudoers file not found or removal failed")
-
-    # Remove any udev rules that might have been created (official asdcontrol method)
-    udev_rules = [
-        "/etc/udev/rules.d/50-apple-xdr.rules",
-        "/etc/udev/rules.d/50-apple-studio.rules",
+    targets = [
+        # Installed by 'sudo make install'
+        ("/usr/local/bin/asdcontrol", "asdcontrol binary"),
+        # Omarchy's custom sudoers file (not part of official asdcontrol)
+        # Official asdcontrol uses udev rules instead of sudoers for permissions
+        ("/etc/sudoers.d/asdcontrol", "Omarchy's asdcontrol sudoers file"),
+        # udev rules that might have been created (official asdcontrol method)
+        ("/etc/udev/rules.d/50-apple-xdr.rules", "udev rule: /etc/udev/rules.d/50-apple-xdr.rules"),
+        ("/etc/udev/rules.d/50-apple-studio.rules", "udev rule: /etc/udev/rules.d/50-apple-studio.rules"),
     ]
 
-    for rule_file in udev_rules:
-        rule_path = Path(rule_file)
-        if rule_path.exists():
-            success = run_command(f"sudo rm -f {rule_file}")
-            if success:
-                print(f"✓ Removed udev rule: {rule_file}")
-            else:
-                print(f"! Failed to remove udev rule: {rule_file}")
+    # Check locally first so a clean system never needs sudo at all
+    to_remove = []
+    for path, description in targets:
+        try:
+            present = Path(path).exists()
+        except PermissionError:
+            # Can't check if file exists due to permissions, try to remove anyway
+            print(f"- Cannot check {description} existence, attempting removal...")
+            present = True
+        if present:
+            to_remove.append((path, description))
         else:
-            print(f"- udev rule not found: {rule_file}")
+            print(f"- {description} not found")
+
+    if not to_remove:
+        return
 
-    # Reload udev rules if any were removed
-    print("Reloading udev rules...")
-    success = run_command("sudo udevadm control --reload-rules")
+    # One sudo transaction for every removal plus the udev reload, so sudo
+    # authenticates once even if the timestamp lapses mid-run. A shell is
+    # only needed to chain the reload; plain removals exec rm directly.
+    paths = [path for path, _ in to_remove]
+    rm_argv = ["rm", "-f", "--", *paths]
+    reload_udev = any(path.startswith("/etc/udev/") for path in paths)
+    if reload_udev:
+        script = shlex.join(rm_argv) + " && udevadm control --reload-rules"
+        success = run_command(["sudo", "sh", "-c", script])
+    else:
+        success = run_command(["sudo", *rm_argv])
     if success:
-        print("✓ Reloaded udev rules")
+        for _, description in to_remove:
+            print(f"✓ Removed {description}")
+        if reload_udev:
+            print("✓ Reloaded udev rules")
     else:
-        print("! Failed to reload udev rules")
+        print("! Failed to remove asdcontrol components")
 
 
 def manage_user_desktop_files():
     """Manage desktop files in user applications directory ONLY"""
     print("Managing .desktop files in user applications directory...")
 
-    home = Path.home()
-    user_apps = home / ".local/share/applications"
-
     # Ensure user applications directory exists
-    user_apps.mkdir(parents=True, exist_ok=True)
+    ensure_dir(USER_APPS)
 
     # Remove unwanted desktop files from user directory
     files_to_remove = [
@@ -405,75 +926,37 @@ def manage_user_desktop_files():
         "Google Photos.desktop",
     ]
 
+    present = scan_dir(USER_APPS)
     for filename in files_to_remove:
-        file_path = user_apps / filename
-        if file_path.exists():
-            file_path.unlink()
-            print(f"✓ Removed {filename}")
-
-
-
-
-
-
-def create_nautilus_vscode_script():
-    """Create Nautilus script for opening files in VS Code or Cursor"""
-    print("Creating Nautilus script for VS Code/Cursor...")
-
-    # Create nautilus scripts directory if it doesn't exist
-    nautilus_scripts_dir = Path.home() / ".local/share/nautilus/scripts"
-    nautilus_scripts_dir.mkdir(parents=True, exist_ok=True)
+        if filename not in present:
+            continue
+        # Ask forgiveness: the file may have vanished since the listing
+        try:
+            os.unlink(present[filename].path)
+        except FileNotFoundError:
+            continue
+        mark_desktop_dirty()
+        print(f"✓ Removed {filename}")
 
-    script_content = """#!/bin/bash
 
-# Nautilus script to open selected files/directories in VS Code or Cursor
 
-# Check which editor command is available (prefer code over cursor)
-EDITOR_CMD=""
-if command -v code &> /dev/null; then
-    EDITOR_CMD="code"
-elif command -v cursor &> /dev/null; then
-    EDITOR_CMD="cursor"
-else
-    zenity --error --text="Neither VS Code (code) nor Cursor (cursor) command found. Please make sure at least one is installed and accessible from the command line."
-    exit 1
-fi
 
-# Get selected files from Nautilus
-# Nautilus provides selected files through environment variables
-IFS=$'\\n'
-if [ -n "$NAUTILUS_SCRIPT_SELECTED_FILE_PATHS" ]; then
-    # Use the file paths provided by Nautilus
-    selected_files=($(echo "$NAUTILUS_SCRIPT_SELECTED_FILE_PATHS"))
-elif [ -n "$NAUTILUS_SCRIPT_SELECTED_URIS" ]; then
-    # Convert URIs to file paths if needed
-    selected_files=()
-    for uri in $(echo "$NAUTILUS_SCRIPT_SELECTED_URIS"); do
-        # Remove file:// prefix and decode URI
-        file_path=$(echo "$uri" | sed 's|^file://||' | python3 -c "import sys, urllib.parse; print(urllib.parse.unquote(sys.stdin.read().strip()))")
-        selected_files+=("$file_path")
-    done
-else
-    zenity --error --text="No files selected."
-    exit 1
-fi
 
-# Open each selected file/directory in the available editor
-for file in "${selected_files[@]}"; do
-    if [ -e "$file" ]; then
-        $EDITOR_CMD "$file" &
-    fi
-done
 
-# Disown the background processes so they don't get killed when script exits
-disown
-"""
+def create_nautilus_vscode_script():
+    """Create Nautilus script for opening files in VS Code or Cursor"""
+    print("Creating Nautilus script for VS Code/Cursor...")
+
+    # Create nautilus scripts directory if it doesn't exist
+    nautilus_scripts_dir = LOCAL_SHARE / "nautilus/scripts"
+    ensure_dir(nautilus_scripts_dir)
 
     script_path = nautilus_scripts_dir / "open-in-vscode"
 
     try:
-        script_path.write_text(script_content)
-        script_path.chmod(0o755)  # Make executable
+        with open(script_path, "wb") as f:
+            f.write(NAUTILUS_VSCODE_SCRIPT)
+            os.fchmod(f.fileno(), 0o755)  # Make executable
         print("✓ Created Nautilus script for VS Code/Cursor")
     except Exception as e:
         print(f"! Failed to create Nautilus script: {e}")
@@ -489,16 +972,111 @@ def remove_webapps_from_user_space():
         "X",
     ]
 
+    webapp_remove = str(OMARCHY_BIN / "omarchy-webapp-remove")
+    # The helper deletes "<name>.desktop" and "icons/<name>.png"; only spawn
+    # it for web apps that still have one of those
+    desktop_files = scan_dir(USER_APPS)
+    icon_files = scan_dir(USER_APPS / "icons")
+
+    present = []
     for webapp_name in webapps_to_remove:
-        success = run_command(f"~/.local/share/omarchy/bin/omarchy-webapp-remove '{webapp_name}'")
-        if success:
-            print(f"✓ Removed {webapp_name}")
+        if (
+            f"{webapp_name}.desktop" in desktop_files
+            or f"{webapp_name}.png" in icon_files
+        ):
+            present.append(webapp_name)
         else:
             print(f"- {webapp_name} not found or already removed")
 
+    if not present:
+        return
+
+    # The helper takes several names, so one process removes them all
+    if run_command([webapp_remove, *present]):
+        mark_desktop_dirty()
+        print(f"✓ Removed {', '.join(present)}")
+    else:
+        print(f"! Failed to remove web apps: {', '.join(present)}")
+
+
+def prefetch_webapp_icons(webapps, refresh=False):
+    """Download web app icons concurrently into the icons directory
+
+    omarchy-webapp-install curls every icon URL itself, one TLS handshake per
+    app, but also accepts the name of a file already in the icons directory.
+    Each worker keeps its own keep-alive connection per host, reused for any
+    further icons it fetches. An existing icon is kept unless it isn't a PNG
+    (such as an error page) or refresh is set (--force). Returns the icon
+    argument to pass for each app name: the local file name when the icon is
+    in place, else the original URL so the helper can still fetch it.
+    """
+    icon_dir = USER_APPS / "icons"
+    ensure_dir(icon_dir)
+
+    worker = threading.local()
+    opened = []
+
+    def download(url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != "https":
+            return None
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        if not hasattr(worker, "connections"):
+            worker.connections = {}
+        try:
+            conn = worker.connections.get(parts.netloc)
+            if conn is None:
+                conn = http.client.HTTPSConnection(parts.netloc, timeout=30)
+                worker.connections[parts.netloc] = conn
+                opened.append(conn)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the helper will retry this icon
+            worker.connections.pop(parts.netloc).close()
+            return None
+        if response.status != 200 or not data.startswith(_PNG_SIGNATURE):
+            return None
+        return data
+
+    def prefetch(app):
+        local_name = f"{app['name']}.png"
+        target = icon_dir / local_name
+        have_icon = is_png(target)
+        if have_icon and not refresh:
+            return local_name
+
+        data = download(app["icon"])
+        if data is None:
+            return local_name if have_icon else app["icon"]
+
+        tmp_path = target.with_name(target.name + ".tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, target)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            return local_name if have_icon else app["icon"]
+        return local_name
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(4, len(webapps))
+        ) as executor:
+            icon_args = list(executor.map(prefetch, webapps))
+    finally:
+        for conn in opened:
+            conn.close()
 
-def create_webapps():
-    """Create web apps using web2app"""
+    return {app["name"]: icon_arg for app, icon_arg in zip(webapps, icon_args)}
+
+
+def create_webapps(refresh_icons=False):
+    """Create web apps using web2app
+
+    With refresh_icons, icons already downloaded are fetched again.
+    """
     print("Creating web apps...")
 
     webapps = [
@@ -520,11 +1098,24 @@ def create_webapps():
     ]
 
     # Use repo helper which integrates with this setup
-    for app in webapps:
-        success = run_command(
-            f'~/.local/share/omarchy/bin/omarchy-webapp-install "{app["name"]}" "{app["url"]}" "{app["icon"]}"'
+    webapp_install = str(OMARCHY_BIN / "omarchy-webapp-install")
+
+    # Fetch the icons up front; the installs then only write their own
+    # files, so run them together and report in order
+    icon_args = prefetch_webapp_icons(webapps, refresh=refresh_icons)
+    results = run_concurrently(
+        *(
+            functools.partial(
+                run_command,
+                [webapp_install, app["name"], app["url"], icon_args[app["name"]]],
+            )
+            for app in webapps
         )
+    )
+
+    for app, success in zip(webapps, results):
         if success:
+            mark_desktop_dirty()
             print(f"✓ Created {app['name']} web app")
         else:
             print(f"! Failed to create {app['name']} web app")
@@ -534,8 +1125,7 @@ def customize_bash_config():
     """Add bash customizations to user's .bashrc with backup and fencing"""
     print("Adding bash customizations to ~/.bashrc...")
 
-    home = Path.home()
-    bashrc_path = home / ".bashrc"
+    bashrc_path = HOME / ".bashrc"
 
     # Create backup before editing
     backup_file_before_edit(bashrc_path)
@@ -587,8 +1177,7 @@ def update_user_hypridle_config():
     """Update user hypridle configuration with backup and fencing"""
     print("Updating user hypridle configuration...")
 
-    home = Path.home()
-    hypridle_conf = home / ".config/hypr/hypridle.conf"
+    hypridle_conf = CONFIG_DIR / "hypr/hypridle.conf"
 
     if not hypridle_conf.exists():
         print("! ~/.config/hypr/hypridle.conf not found, skipping")
@@ -620,13 +1209,12 @@ def update_user_hyprland_config():
     """Update user hyprland configuration with backup and fencing"""
     print("Updating user hyprland configuration...")
 
-    home = Path.home()
-    hypr_dir = home / ".config/hypr"
+    hypr_dir = CONFIG_DIR / "hypr"
     
     # Check if hyprland config directory exists
     if not hypr_dir.exists():
-        print("! ~/.config/hypr/ directory not found, skipping")
-        return False
+        print("- ~/.config/hypr/ directory not found, skipping")
+        return True
 
     # Define configurations for each file
     config_files = {
@@ -664,14 +1252,18 @@ def update_user_hyprland_config():
     # Update specific config files
     for config_file, customizations in config_files.items():
         config_path = hypr_dir / config_file
-        
-        # Create backup if file exists
-        if config_path.exists():
-            backup_file_before_edit(config_path)
+
+        # Create backup (a no-op for files that don't exist yet)
+        backup_file_before_edit(config_path)
         
         # Add customizations to file
+        # Hyprland runs a duplicated bind twice, so skip the flat bind/env
+        # lines already set; input.conf is a block and is added as-is
         success = add_fenced_content_to_file(
-            config_path, customizations, f"OMARCHY {config_file.upper()} CUSTOMIZATIONS"
+            config_path,
+            customizations,
+            f"OMARCHY {config_file.upper()} CUSTOMIZATIONS",
+            skip_present_lines=config_file in ("bindings.conf", "envs.conf"),
         )
         
         if success:
@@ -685,7 +1277,9 @@ def update_user_hyprland_config():
         backup_file_before_edit(hyprland_conf)
         
         success = add_fenced_content_to_file(
-            hyprland_conf, main_config, "OMARCHY HYPRLAND CUSTOMIZATIONS"
+            hyprland_conf,
+            main_config,
+            "OMARCHY HYPRLAND CUSTOMIZATIONS",
         )
         
         if success:
@@ -694,8 +1288,7 @@ def update_user_hyprland_config():
             print("! Failed to add main hyprland.conf customizations")
             all_success = False
     else:
-        print("! ~/.config/hypr/hyprland.conf not found, skipping main config")
-        all_success = False
+        print("- ~/.config/hypr/hyprland.conf not found, skipping main config")
 
     return all_success
 
@@ -716,11 +1309,10 @@ def customize_terminal_paste():
     """
     print("Configuring terminal Mac-style copy/paste...")
 
-    home = Path.home()
     all_ok = True
 
     # Alacritty (TOML — modify in place)
-    alacritty_conf = home / ".config/alacritty/alacritty.toml"
+    alacritty_conf = CONFIG_DIR / "alacritty/alacritty.toml"
     if alacritty_conf.exists():
         backup_file_before_edit(alacritty_conf)
         content = alacritty_conf.read_text()
@@ -750,12 +1342,12 @@ def customize_terminal_paste():
             print("✓ Enabled selection auto-copy in Alacritty")
 
         if changed:
-            alacritty_conf.write_text(content)
+            atomic_write_text(alacritty_conf, content)
     else:
         print("- Alacritty config not found, skipping")
 
     # Ghostty (line-based — fenced append covers both binding and copy-on-select)
-    ghostty_conf = home / ".config/ghostty/config"
+    ghostty_conf = CONFIG_DIR / "ghostty/config"
     if ghostty_conf.exists():
         backup_file_before_edit(ghostty_conf)
         success = add_fenced_content_to_file(
@@ -791,8 +1383,7 @@ def customize_ghostty_mac_keys():
     """
     print("Configuring Ghostty Mac-style tabs/splits...")
 
-    home = Path.home()
-    ghostty_conf = home / ".config/ghostty/config"
+    ghostty_conf = CONFIG_DIR / "ghostty/config"
     if not ghostty_conf.exists():
         print("- Ghostty config not found, skipping")
         return True
@@ -842,12 +1433,11 @@ def customize_mako_ghostty_persistent():
     """
     print("Configuring mako to keep Ghostty notifications persistent...")
 
-    home = Path.home()
-    mako_conf = home / ".config/mako/config"
+    mako_conf = CONFIG_DIR / "mako/config"
 
     if not mako_conf.exists():
         print("- ~/.config/mako/config not found, skipping")
-        return False
+        return True
 
     backup_file_before_edit(mako_conf)
     success = add_fenced_content_to_file(
@@ -859,7 +1449,7 @@ def customize_mako_ghostty_persistent():
         "MAKO GHOSTTY PERSISTENT",
     )
     if success:
-        run_command("makoctl reload")
+        run_command(["makoctl", "reload"], quiet=True)
         print("✓ Ghostty notifications now persist until dismissed")
     else:
         print("! Failed to update mako config")
@@ -884,28 +1474,25 @@ def configure_chrome_wayland():
     """
     print("Configuring Google Chrome for native Wayland...")
 
-    home = Path.home()
-    flags = "--ozone-platform=wayland --ozone-platform-hint=wayland --enable-features=TouchpadOverscrollHistoryNavigation"
+    flags = " ".join(CHROME_WAYLAND_FLAGS)
 
     # Fallback: chrome-flags.conf (read by some wrappers)
-    chrome_flags_conf = home / ".config/chrome-flags.conf"
+    chrome_flags_conf = CONFIG_DIR / "chrome-flags.conf"
     try:
-        chrome_flags_conf.write_text(
-            "--ozone-platform=wayland\n"
-            "--ozone-platform-hint=wayland\n"
-            "--enable-features=TouchpadOverscrollHistoryNavigation\n"
-        )
-        print(f"✓ Wrote {chrome_flags_conf}")
+        if write_if_changed(chrome_flags_conf, CHROME_FLAGS_CONF):
+            print(f"✓ Wrote {chrome_flags_conf}")
+        else:
+            print(f"- {chrome_flags_conf} already up to date")
     except Exception as e:
         print(f"! Failed to write chrome-flags.conf: {e}")
 
     # Primary: user-local desktop override with flags injected into Exec=
     system_desktop = Path("/usr/share/applications/google-chrome.desktop")
-    user_desktop = home / ".local/share/applications/google-chrome.desktop"
+    user_desktop = USER_APPS / "google-chrome.desktop"
 
     if not system_desktop.exists():
         print("- /usr/share/applications/google-chrome.desktop not found, skipping desktop override")
-        return False
+        return True
 
     try:
         content = system_desktop.read_text()
@@ -925,8 +1512,13 @@ def configure_chrome_wayland():
                 injected += 1
             new_lines.append(line)
 
-        user_desktop.parent.mkdir(parents=True, exist_ok=True)
-        user_desktop.write_text("\n".join(new_lines) + "\n")
+        ensure_dir(user_desktop.parent)
+        # Leave an identical override untouched so its mtime doesn't force a
+        # desktop database rebuild on re-runs
+        if not write_if_changed(user_desktop, "\n".join(new_lines) + "\n"):
+            print(f"- {user_desktop} already up to date")
+            return True
+        mark_desktop_dirty()
         print(f"✓ Wrote {user_desktop} with Wayland flags ({injected} Exec lines patched)")
         return True
     except Exception as e:
@@ -935,32 +1527,72 @@ def configure_chrome_wayland():
 
 
 def set_default_browser():
-    """Set Google Chrome as the default browser"""
-    print("Setting google-chrome.desktop as default browser...")
+    """Set Google Chrome as the default browser
 
-    if not shutil.which("xdg-settings"):
-        print("! xdg-settings not found, skipping default browser setup")
-        return
+    Writes the [Default Applications] entries that xdg-settings/xdg-mime
+    would write on a non-DE session straight into ~/.config/mimeapps.list,
+    so the file is read and rewritten once instead of once per command.
+    Only the affected key=value lines change; comments, other sections and
+    the user's layout are kept verbatim, as xdg-mime keeps them.
+    """
+    print("Setting google-chrome.desktop as default browser...")
 
-    commands = [
-        # Prefer setting Chrome directly
-        "xdg-settings set default-web-browser google-chrome.desktop",
-        "xdg-mime default google-chrome.desktop x-scheme-handler/http",
-        "xdg-mime default google-chrome.desktop x-scheme-handler/https",
+    mimeapps = CONFIG_DIR / "mimeapps.list"
+    defaults = {
+        # Same handlers `xdg-settings set default-web-browser` sets
+        "text/html": "google-chrome.desktop",
+        "x-scheme-handler/http": "google-chrome.desktop",
+        "x-scheme-handler/https": "google-chrome.desktop",
+        "x-scheme-handler/about": "google-chrome.desktop",
+        "x-scheme-handler/unknown": "google-chrome.desktop",
         # Typora as default markdown editor
-        "xdg-mime default typora.desktop text/markdown",
-        "xdg-mime default typora.desktop text/x-markdown",
-    ]
+        "text/markdown": "typora.desktop",
+        "text/x-markdown": "typora.desktop",
+    }
 
-    all_ok = True
-    for command in commands:
-        success = run_command(command)
-        if success:
-            print(f"✓ {command}")
+    try:
+        try:
+            lines = mimeapps.read_text().splitlines()
+        except FileNotFoundError:
+            lines = []
+
+        # Rewrite the keys we set in place and note where the section's
+        # last entry is, so missing keys are added right after it
+        missing = dict(defaults)
+        in_section = False
+        insert_at = None
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith("["):
+                in_section = stripped == "[Default Applications]"
+                if in_section:
+                    insert_at = index + 1
+                continue
+            if not in_section or stripped.startswith("#") or "=" not in stripped:
+                continue
+            insert_at = index + 1
+            key = stripped.split("=", 1)[0].strip()
+            if key in defaults:
+                lines[index] = f"{key}={defaults[key]}"
+                missing.pop(key, None)
+
+        added = [f"{key}={value}" for key, value in missing.items()]
+        if insert_at is None:
+            if lines and lines[-1].strip():
+                lines.append("")
+            lines += ["[Default Applications]", *added]
         else:
-            print(f"! Failed: {command}")
-            all_ok = False
-    return all_ok
+            lines[insert_at:insert_at] = added
+
+        ensure_dir(mimeapps.parent)
+        write_if_changed(mimeapps, "\n".join(lines) + "\n")
+    except OSError as e:
+        print(f"! Failed to update {mimeapps}: {e}")
+        return False
+
+    for mime_type, desktop_file in defaults.items():
+        print(f"✓ {mime_type} → {desktop_file}")
+    return True
 
 
 def reset_git_config():
@@ -970,32 +1602,65 @@ def reset_git_config():
     # Unset the global git settings that were set during installation
     git_configs_to_unset = ["pull.rebase", "init.defaultBranch"]
 
+    # One git call lists every global key (git prints them lowercased), so
+    # --unset is only spawned for keys that are actually set
+    listing = command_output(["git", "config", "--global", "--list"]) or ""
+    existing = {line.split("=", 1)[0] for line in listing.splitlines()}
+
     for config in git_configs_to_unset:
-        success = run_command(f"git config --global --unset {config}")
+        if config.lower() not in existing:
+            print(f"- git config {config} was not set or already unset")
+            continue
+
+        success = run_command(["git", "config", "--global", "--unset", config], quiet=True)
         if success:
             print(f"✓ Unset git config {config}")
         else:
             print(f"- git config {config} was not set or already unset")
 
 
+def mark_desktop_dirty():
+    """Record that a user .desktop file changed and the database needs a rebuild"""
+    global _desktop_dirty
+    _desktop_dirty = True
+
+
+def desktop_cache_is_fresh(apps_dir):
+    """Check whether mimeinfo.cache in apps_dir is newer than every .desktop file"""
+    entries = scan_dir(apps_dir)
+    cache = entries.get("mimeinfo.cache")
+    if cache is None:
+        return False
+
+    try:
+        cache_mtime = cache.stat().st_mtime_ns
+        return all(
+            entry.stat().st_mtime_ns <= cache_mtime
+            for name, entry in entries.items()
+            if name.endswith(".desktop")
+        )
+    except OSError:
+        return False
+
+
 def update_desktop_database():
     """Update the desktop database"""
     print("Updating desktop database...")
 
-    if not shutil.which("update-desktop-database"):
-        print("! update-desktop-database not found, skipping")
-        return
+    if not have("update-desktop-database"):
+        print("- update-desktop-database not found, skipping")
+        return True
 
-    home = Path.home()
-    user_apps = home / ".local/share/applications"
+    if not _desktop_dirty and desktop_cache_is_fresh(USER_APPS):
+        print("- No desktop files changed, database already up to date")
+        return True
 
-    success = run_command(f"update-desktop-database {user_apps}")
+    success = run_command(["update-desktop-database", str(USER_APPS)])
     if success:
         print("✓ Desktop database updated")
-        return True
     else:
         print("! Failed to update desktop database")
-        return False
+    return success
 
 
 def customize_waybar():
@@ -1005,16 +1670,15 @@ def customize_waybar():
     """
     print("Configuring Waybar language display...")
 
-    home = Path.home()
     # Prefer JSONC file used by this repo; fallback to plain config if present
-    waybar_config_jsonc = home / ".config/waybar/config.jsonc"
-    waybar_config_plain = home / ".config/waybar/config"
+    waybar_config_jsonc = CONFIG_DIR / "waybar/config.jsonc"
+    waybar_config_plain = CONFIG_DIR / "waybar/config"
     waybar_config = waybar_config_jsonc if waybar_config_jsonc.exists() else waybar_config_plain
-    waybar_style = home / ".config/waybar/style.css"
+    waybar_style = CONFIG_DIR / "waybar/style.css"
 
     if not waybar_config.exists():
-        print("! Waybar config file not found, skipping language display setup")
-        return
+        print("- Waybar config file not found, skipping language display setup")
+        return True
 
     try:
         # Create backups before editing
@@ -1022,13 +1686,15 @@ def customize_waybar():
         if waybar_style.exists():
             backup_file_before_edit(waybar_style)
 
-        # Read config; parse JSONC if necessary
         content = waybar_config.read_text()
+
+        # Look for the module on the parsed config, so a commented-out
+        # definition in the JSONC text doesn't count as configured
         if waybar_config.suffix == ".jsonc":
             parsed = parse_jsonc_to_json(content)
         else:
-            parsed = content
-
+            # Tolerate a header comment like the one written for .jsonc
+            parsed = _LEADING_LINE_COMMENT_RE.sub("", content, count=1)
         config_data = json.loads(parsed)
 
         # Check if hyprland/language module is already configured
@@ -1061,9 +1727,9 @@ def customize_waybar():
             rendered_json = json.dumps(config_data, indent=2)
             if waybar_config.suffix == ".jsonc":
                 config_with_comment = f"// OMARCHY CUSTOMIZATION: Added hyprland/language module\n{rendered_json}\n"
-                waybar_config.write_text(config_with_comment)
+                atomic_write_text(waybar_config, config_with_comment)
             else:
-                waybar_config.write_text(rendered_json)
+                atomic_write_text(waybar_config, rendered_json)
             print("✓ Updated Waybar configuration file")
 
         # Add CSS styling for the language indicator using fencing
@@ -1104,124 +1770,117 @@ def customize_waybar():
     return True
 
 
+def file_stamp(path):
+    """Fingerprint path by mtime and size, to notice edits without reading it"""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def record_file_stamp(stamp_file, stamp):
+    """Save a file_stamp(); failing to save one only costs a re-read next run"""
+    try:
+        ensure_dir(stamp_file.parent)
+        stamp_file.write_text(stamp)
+    except OSError:
+        pass
+
+
 def configure_toshy_keyboard_layout():
     """Configure custom Toshy keyboard layout with Mac-style modifier mapping and backup"""
     print("Configuring custom Toshy keyboard layout...")
 
-    home = Path.home()
-    toshy_config = home / ".config/toshy/toshy_config.py"
+    toshy_config = CONFIG_DIR / "toshy/toshy_config.py"
 
-    if not toshy_config.exists():
+    try:
+        stamp = file_stamp(toshy_config)
+    except FileNotFoundError:
         print("! Toshy config file not found")
         return
 
-    # Create backup before editing
-    backup_file_before_edit(toshy_config)
+    # Unchanged since we last customized it: skip reading the whole file
+    try:
+        if TOSHY_STAMP_FILE.read_text() == stamp:
+            print("- Custom keyboard layout already configured")
+            return
+    except OSError:
+        pass
 
     try:
-        content = toshy_config.read_text()
+        content = toshy_config.read_bytes()
 
-        # Check if our custom configuration already exists
-        if "OMARCHY CUSTOMIZATION: Override keyboard type" in content:
-            print("- Custom keyboard layout already configured")
+        # Without the modmaps slice there is nothing to edit; bail out before
+        # taking a backup
+        if TOSHY_SLICE_START not in content:
+            print("! user_custom_modmaps slice not found in Toshy config")
             return
 
-        # 1. Add keyboard type override to disable built-in modmaps
-        settings_marker = "cnfg.watch_shared_devices()     # Look for network KVM apps and watch logs (on server only)"
-        if settings_marker in content:
-            override_config = """
-        # === START OMARCHY CUSTOMIZATION: Override keyboard type ===
-        cnfg.override_kbtype = 'IBM'     # Use IBM type to avoid Windows/Mac/Chromebook built-in modmaps
-        # === END OMARCHY CUSTOMIZATION: Override keyboard type ==="""
+        # Create backup before editing
+        backup_file_before_edit(toshy_config)
+
+        # Find every anchor in one pass over the config, then apply all the
+        # edits in a single rebuild instead of one full-string replace each
+        edits = []
+        added_override = False
+        slice_start = slice_end = -1
+        modmap_calls = []
+        for match in _TOSHY_ANCHORS_RE.finditer(content):
+            anchor = match.group()
+            if anchor == TOSHY_CUSTOMIZED_MARKER:
+                print("- Custom keyboard layout already configured")
+                record_file_stamp(TOSHY_STAMP_FILE, stamp)
+                return
+            elif anchor == TOSHY_SETTINGS_MARKER:
+                edits.append((match.end(), match.end(), TOSHY_OVERRIDE_CONFIG))
+                added_override = True
+            elif anchor == TOSHY_SLICE_START:
+                if slice_start < 0:
+                    slice_start = match.end()
+            elif anchor == TOSHY_SLICE_END:
+                if slice_start >= 0 and slice_end < 0:
+                    slice_end = match.start()
+            elif anchor == b"modmap(":
+                modmap_calls.append(match.start())
+            else:
+                disabled = b"    # " + anchor.lstrip() + b"  # DISABLED by OMARCHY for Hyprland"
+                edits.append((match.start(), match.end(), disabled))
 
-            content = content.replace(
-                settings_marker, settings_marker + override_config
-            )
+        # 1. Add keyboard type override to disable built-in modmaps
+        if added_override:
             print("✓ Added keyboard type override with clear marking")
 
         # 2. Add custom modmaps to user_custom_modmaps slice
-        start_marker = "###  SLICE_MARK_START: user_custom_modmaps  ###"
-        end_marker = "###  SLICE_MARK_END: user_custom_modmaps  ###"
-
-        custom_modmaps = """# === START OMARCHY CUSTOMIZATION: Custom modmaps ===
-modmap("OMARCHY custom layout: Cmd→Ctrl, Ctrl→Alt, keep Super - GUI", {
-    # Left-hand modifiers
-    Key.LEFT_ALT:  Key.LEFT_CTRL,   # Alt (Cmd) → Ctrl
-    Key.LEFT_CTRL: Key.LEFT_ALT,    # Ctrl      → Alt
-    Key.LEFT_META: Key.LEFT_META,   # Win/Super stays Super
-
-    # Right-hand modifiers (optional)
-    Key.RIGHT_ALT:  Key.RIGHT_CTRL,
-    Key.RIGHT_CTRL: Key.RIGHT_ALT,
-    Key.RIGHT_META: Key.RIGHT_META,
-}, when = lambda ctx:
-    not matchProps(clas=termStr)(ctx)
-)
-
-modmap("OMARCHY custom layout: Terminals - preserve Ctrl/Alt, keep Super", {
-    # In terminals: keep normal Ctrl/Alt behavior but preserve Super
-    Key.LEFT_ALT:  Key.LEFT_ALT,    # Alt stays Alt
-    Key.LEFT_CTRL: Key.LEFT_CTRL,   # Ctrl stays Ctrl  
-    Key.LEFT_META: Key.LEFT_META,   # Win/Super stays Super
-
-    # Right-hand modifiers
-    Key.RIGHT_ALT:  Key.RIGHT_ALT,
-    Key.RIGHT_CTRL: Key.RIGHT_CTRL,
-    Key.RIGHT_META: Key.RIGHT_META,
-}, when = lambda ctx:
-    matchProps(clas=termStr)(ctx)
-)
-# === END OMARCHY CUSTOMIZATION: Custom modmaps ==="""
-
-        if start_marker in content and end_marker in content:
-            # Find the slice and insert the modmaps
-            start_idx = content.find(start_marker) + len(start_marker)
-            end_idx = content.find(end_marker)
-
-            # Check if there's already content between the markers
-            slice_content = content[start_idx:end_idx]
-            if "modmap(" not in slice_content:
-                # Insert our custom modmaps between the markers
-                new_content = (
-                    content[:start_idx]
-                    + f"\n\n{custom_modmaps}\n\n"
-                    + content[end_idx:]
-                )
-                content = new_content
-                print("✓ Added custom keyboard layout to user_custom_modmaps slice")
-            else:
-                print("- Custom modmap already exists in user_custom_modmaps slice")
-        else:
+        if slice_start < 0 or slice_end < 0:
             print("! user_custom_modmaps slice not found in Toshy config")
             return
 
-        # 3. Disable emacs-style Super key mappings that interfere with Hyprland
-        emacs_mappings = [
-            'C("Super-a"):               C("Home"),                      # Beginning of Line',
-            'C("Super-e"):               C("End"),                       # End of Line',
-            'C("Super-b"):               C("Left"),',
-            'C("Super-f"):               C("Right"),',
-            'C("Super-n"):               C("Down"),',
-            'C("Super-p"):               C("Up"),',
-            'C("Super-k"):              [C("Shift-End"), C("Backspace")],',
-            'C("Super-d"):               C("Delete"),',
-        ]
+        # Check if there's already content between the markers
+        if any(slice_start <= pos < slice_end for pos in modmap_calls):
+            print("- Custom modmap already exists in user_custom_modmaps slice")
+        else:
+            # Insert our custom modmaps between the markers
+            edits.append((slice_start, slice_end, b"\n\n" + TOSHY_CUSTOM_MODMAPS + b"\n\n"))
+            print("✓ Added custom keyboard layout to user_custom_modmaps slice")
 
-        for mapping in emacs_mappings:
-            if mapping in content:
-                content = content.replace(
-                    f"    {mapping}",
-                    f"    # {mapping}  # DISABLED by OMARCHY for Hyprland",
-                )
+        # 3. Disable emacs-style Super key mappings that interfere with Hyprland
         print("✓ Disabled emacs-style Super key mappings with clear marking")
 
-        # Write the updated content
-        toshy_config.write_text(content)
+        parts = []
+        cursor = 0
+        for edit_start, edit_end, replacement in sorted(edits):
+            parts.append(content[cursor:edit_start])
+            parts.append(replacement)
+            cursor = edit_end
+        parts.append(content[cursor:])
+        content = b"".join(parts)
+
+        # Write the updated content atomically
+        atomic_write_bytes(toshy_config, content)
+        record_file_stamp(TOSHY_STAMP_FILE, file_stamp(toshy_config))
         print("✓ Updated Toshy configuration file")
 
         # Restart Toshy service to apply keyboard layout changes
         print("Restarting Toshy service to apply changes...")
-        success = run_command("systemctl --user restart toshy-config.service")
+        success = run_command(["systemctl", "--user", "restart", "toshy-config.service"])
         if success:
             print("✓ Restarted Toshy service")
         else:
@@ -1235,42 +1894,60 @@ def configure_toshy_systemd():
     """Configure Toshy systemd service with proper environment variables"""
     print("Configuring Toshy systemd service...")
 
-    home = Path.home()
     service_template = (
-        home / ".config/toshy/systemd-user-service-units/toshy-config.service"
+        CONFIG_DIR / "toshy/systemd-user-service-units/toshy-config.service"
     )
-    user_systemd_dir = home / ".config/systemd/user"
+    user_systemd_dir = CONFIG_DIR / "systemd/user"
     service_dest = user_systemd_dir / "toshy-config.service"
 
-    if not service_template.exists():
+    try:
+        template_mtime = service_template.stat().st_mtime_ns
+    except FileNotFoundError:
         print("! Toshy service template not found")
         return
 
     # Ensure user systemd directory exists
-    user_systemd_dir.mkdir(parents=True, exist_ok=True)
+    ensure_dir(user_systemd_dir)
 
     try:
-        # Read the template service file
-        content = service_template.read_text()
-
-        # Add XDG_SESSION_TYPE=wayland if not already present
-        if "Environment=XDG_SESSION_TYPE=wayland" not in content:
-            content = content.replace(
-                "Environment=TERM=xterm",
-                "Environment=TERM=xterm\nEnvironment=XDG_SESSION_TYPE=wayland",
+        # A patched unit written since the template last changed is current;
+        # skip re-reading and re-patching the template
+        try:
+            unit_is_current = (
+                service_dest.stat().st_mtime_ns >= template_mtime
+                and b"Environment=XDG_SESSION_TYPE=wayland" in service_dest.read_bytes()
             )
-            print("✓ Added XDG_SESSION_TYPE=wayland to service file")
+        except FileNotFoundError:
+            unit_is_current = False
 
-        # Write the updated service file to user systemd directory
-        service_dest.write_text(content)
-        print("✓ Updated Toshy systemd service file")
+        if unit_is_current:
+            print("- Toshy systemd service file already up to date")
+        else:
+            # Read the template service file
+            content = service_template.read_text()
 
-        # Reload systemd and enable/start the service
-        success = run_command("systemctl --user daemon-reload")
-        if success:
-            print("✓ Reloaded systemd daemon")
+            # Add XDG_SESSION_TYPE=wayland if not already present
+            if "Environment=XDG_SESSION_TYPE=wayland" not in content:
+                content = content.replace(
+                    "Environment=TERM=xterm",
+                    "Environment=TERM=xterm\nEnvironment=XDG_SESSION_TYPE=wayland",
+                )
+                print("✓ Added XDG_SESSION_TYPE=wayland to service file")
 
-        success = run_command("systemctl --user enable toshy-config.service --now")
+            # Write the updated service file to user systemd directory; an
+            # identical unit needs neither a write nor a daemon-reload
+            if write_if_changed(service_dest, content):
+                print("✓ Updated Toshy systemd service file")
+
+                # Reload systemd so it picks up the new unit
+                success = run_command(["systemctl", "--user", "daemon-reload"])
+                if success:
+                    print("✓ Reloaded systemd daemon")
+            else:
+                print("- Toshy systemd service file already up to date")
+
+        # Enable/start the service
+        success = run_command(["systemctl", "--user", "enable", "toshy-config.service", "--now"])
         if success:
             print("✓ Enabled and started Toshy service")
         else:
@@ -1280,113 +1957,122 @@ def configure_toshy_systemd():
         print(f"! Error configuring Toshy systemd service: {e}")
 
 
-def install_and_configure_keyd():
-    """Install keyd and configure Mac-like keyboard behavior with backup"""
-    print("Installing and configuring keyd...")
+def prepare_keyd(overwrite=None):
+    """Decide how to set up keyd and queue its package for apply_package_changes()
+
+    Runs before any package work so the one interactive question is asked
+    up front; overwrite=True/False (--overwrite-keyd/--keep-keyd) answers it
+    in advance, and with no terminal to ask on an existing config is kept.
+    Returns None if an existing configuration is to be kept, else an
+    (up_to_date, needs_backup) pair for install_and_configure_keyd().
+    """
+    print("Checking keyd configuration...")
+
+    # One listing tells whether both the config and its backup exist
+    keyd_entries = scan_dir(KEYD_CONFIG_PATH.parent)
 
-    # Check if keyd config already exists and create backup
-    keyd_config_path = Path("/etc/keyd/default.conf")
-    if keyd_config_path.exists():
+    # Compare against what's installed first: an identical config needs no
+    # overwrite prompt, no write and no keyd reload
+    existing_config = None
+    if KEYD_CONFIG_PATH.name in keyd_entries:
+        try:
+            existing_config = KEYD_CONFIG_PATH.read_bytes()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Present but unreadable; treat as a foreign config
+            existing_config = b""
+    up_to_date = existing_config == KEYD_CONFIG
+
+    needs_backup = False
+    if up_to_date:
+        print("- keyd configuration already up to date")
+    elif existing_config is not None:
         print("✓ Found existing keyd configuration")
-        # Create backup by copying to .original
-        backup_path = Path("/etc/keyd/default.conf.original")
-        if not backup_path.exists():
-            success = run_command(
-                "sudo cp /etc/keyd/default.conf /etc/keyd/default.conf.original"
-            )
-            if success:
-                print("✓ Created backup: /etc/keyd/default.conf.original")
-            else:
-                print("! Failed to create backup")
+        # The backup itself is taken in the same sudo call that overwrites
+        if KEYD_BACKUP_PATH.name not in keyd_entries:
+            needs_backup = True
         else:
-            print("- Backup already exists: /etc/keyd/default.conf.original")
-
-        print("⚠️  WARNING: Will overwrite existing keyd configuration!")
-        response = (
-            input("Do you want to continue and overwrite it? (y/N): ").strip().lower()
-        )
-        if response != "y" and response != "yes":
+            print(f"- Backup already exists: {KEYD_BACKUP_PATH}")
+
+        if overwrite is None and not sys.stdin.isatty():
+            # Nobody to ask (piped or unattended run); keep what's there
+            print("- Keeping existing keyd configuration (non-interactive; use --overwrite-keyd)")
+            overwrite = False
+        elif overwrite is None:
+            print("⚠️  WARNING: Will overwrite existing keyd configuration!")
+            response = (
+                input("Do you want to continue and overwrite it? (y/N): ").strip().lower()
+            )
+            overwrite = response == "y" or response == "yes"
+        elif overwrite:
+            print("⚠️  Overwriting existing keyd configuration (--overwrite-keyd)")
+        if not overwrite:
             print("Skipping keyd configuration.")
-            return
-
-    # Install keyd
-    print("Installing keyd...")
-    success = run_command("yay -S --noconfirm --needed keyd")
-
-    if success:
-        print("✓ keyd installed successfully")
-    else:
-        print("! keyd installation failed")
-        return
+            return None
 
-    # Enable and start keyd service
-    print("Enabling and starting keyd service...")
-    success = run_command("sudo systemctl enable --now keyd")
-    if success:
-        print("✓ keyd service enabled and started")
-    else:
-        print("! Failed to enable/start keyd service")
+    PKGS_TO_INSTALL.append("keyd")
+    return up_to_date, needs_backup
 
-    # Create keyd configuration with clear fencing
-    print("Creating keyd configuration...")
-    keyd_config = """# === START OMARCHY CUSTOMIZATION ===
-# OMARCHY: Mac-like keyboard behavior configuration
-# This file can be reverted by restoring from /etc/keyd/default.conf.original
 
-# Apply to every keyboard
-[ids]
-*
+def install_and_configure_keyd(plan):
+    """Configure Mac-like keyboard behavior with keyd, as decided by prepare_keyd()
 
-# ----  MAIN LAYER  -------------------------------------------------
-[main]
-# Map physical Alt to a custom layer that acts like Control but with special arrow behavior
-leftalt = layer(mac_control)
-leftcontrol = layer(alt)
-rightalt = layer(mac_control)  
-rightcontrol = layer(alt)
+    Returns True unless a step failed; keeping an existing configuration
+    counts as success.
+    """
+    if plan is None:
+        return True
+    up_to_date, needs_backup = plan
 
-# ----  MAC_CONTROL LAYER (acts like Control but with Mac-style arrows) ----
-[mac_control:C]
-left = home
-right = end
+    print("Configuring keyd...")
 
-# ----  ALT LAYER (physical Ctrl now acts as Alt) ----
-[alt:A]
-# Exception: preserve Ctrl+C for terminal interrupt
-c = C-c
+    # Installed by apply_package_changes(), which also resets have()'s cache
+    if not have("keyd"):
+        print("! keyd is not installed, skipping keyd configuration")
+        return False
 
-# === END OMARCHY CUSTOMIZATION ===
-"""
+    if up_to_date:
+        if run_command(["systemctl", "is-active", "--quiet", "keyd"]):
+            print("✓ keyd service already running")
+            return True
+        print("Enabling and starting keyd service...")
+        if run_command(["sudo", "systemctl", "enable", "--now", "keyd"]):
+            print("✓ keyd service enabled and started")
+            return True
+        print("! Failed to enable/start keyd service")
+        return False
 
     try:
-        # Ensure /etc/keyd directory exists
-        run_command("sudo mkdir -p /etc/keyd")
-
-        # Write configuration to temporary file first
-        temp_config = Path("/tmp/keyd_default.conf")
-        temp_config.write_text(keyd_config)
-
-        # Copy to /etc/keyd/default.conf
-        success = run_command("sudo cp /tmp/keyd_default.conf /etc/keyd/default.conf")
-        if success:
-            print("✓ Created keyd configuration at /etc/keyd/default.conf")
-        else:
-            print("! Failed to create keyd configuration")
-            return
+        # One sudo transaction backs up, installs, enables and reloads, so
+        # sudo authenticates once instead of once per step. The config is
+        # piped in on stdin rather than staged in a /tmp file.
+        steps = [shlex.join(["mkdir", "-p", "/etc/keyd"])]
+        if needs_backup:
+            steps.append(shlex.join(["cp", "-p", str(KEYD_CONFIG_PATH), str(KEYD_BACKUP_PATH)]))
+        steps += [
+            f"cat > {shlex.quote(str(KEYD_CONFIG_PATH))}",
+            shlex.join(["systemctl", "enable", "--now", "keyd"]),
+            shlex.join(["keyd", "reload"]),
+        ]
+        script = " && ".join(steps)
 
-        # Clean up temp file
-        temp_config.unlink()
+        print("Installing keyd configuration and enabling keyd service...")
+        success = run_command(["sudo", "sh", "-c", script], input=KEYD_CONFIG)
 
-        # Reload keyd configuration
-        print("Reloading keyd configuration...")
-        success = run_command("sudo keyd reload")
         if success:
+            if needs_backup:
+                print(f"✓ Created backup: {KEYD_BACKUP_PATH}")
+            print(f"✓ Created keyd configuration at {KEYD_CONFIG_PATH}")
+            print("✓ keyd service enabled and started")
             print("✓ keyd configuration reloaded")
         else:
-            print("! Failed to reload keyd configuration")
+            print("! Failed to install keyd configuration")
+        return success
 
     except Exception as e:
         print(f"! Error creating keyd configuration: {e}")
+        return False
 
 
 def install_toshy():
@@ -1394,7 +2080,7 @@ def install_toshy():
     print("Installing Toshy keymapper...")
 
     # Check if Toshy is already installed
-    toshy_config_dir = Path.home() / ".config/toshy"
+    toshy_config_dir = CONFIG_DIR / "toshy"
     if toshy_config_dir.exists():
         print(
             "- Toshy appears to be already installed, configuring systemd service and keyboard layout"
@@ -1404,13 +2090,17 @@ def install_toshy():
         return
 
     # Check for required tools (curl or wget)
-    if not shutil.which("curl") and not shutil.which("wget"):
+    if not have("curl") and not have("wget"):
         print("! Neither curl nor wget found, skipping Toshy installation")
         return
 
     # Use official Toshy bootstrap installation
     print("Running Toshy bootstrap installation...")
-    bootstrap_cmd = 'bash -c "$(curl -L https://raw.githubusercontent.com/RedBearAK/toshy/main/scripts/bootstrap.sh || wget -O - https://raw.githubusercontent.com/RedBearAK/toshy/main/scripts/bootstrap.sh)"'
+    bootstrap_cmd = [
+        "bash",
+        "-c",
+        'bash -c "$(curl -L https://raw.githubusercontent.com/RedBearAK/toshy/main/scripts/bootstrap.sh || wget -O - https://raw.githubusercontent.com/RedBearAK/toshy/main/scripts/bootstrap.sh)"',
+    ]
 
     success = run_command(bootstrap_cmd)
     if success:
@@ -1422,8 +2112,58 @@ def install_toshy():
         print("! Toshy installation failed")
 
 
+def customization_state():
+    """Hash this script, which pins every package list and edit it applies
+
+    Only the script is hashed, not the system: packages or configs changed
+    by hand after a completed run go unnoticed until the script changes or
+    --force is given.
+    """
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def completed_state():
+    """Return the state recorded by the last fully successful run, if any"""
+    try:
+        return STATE_FILE.read_text().strip()
+    except OSError:
+        return None
+
+
 def main():
     """Main customization function"""
+    parser = argparse.ArgumentParser(description="Post-install customization for Omarchy")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="re-apply even if this version of the script already completed "
+        "(needed after packages or configs changed outside this script)",
+    )
+    keyd_choice = parser.add_mutually_exclusive_group()
+    keyd_choice.add_argument(
+        "--overwrite-keyd",
+        dest="overwrite_keyd",
+        action="store_const",
+        const=True,
+        help="replace an existing /etc/keyd/default.conf without asking",
+    )
+    keyd_choice.add_argument(
+        "--keep-keyd",
+        dest="overwrite_keyd",
+        action="store_const",
+        const=False,
+        help="never replace an existing /etc/keyd/default.conf",
+    )
+    args = parser.parse_args()
+
+    # Every step is idempotent, but rediscovering that costs dozens of
+    # subprocesses; skip the whole run when this exact script already succeeded
+    state = customization_state()
+    if not args.force and completed_state() == state:
+        print("✓ Already customized with this version of customize.py, nothing to do")
+        print("- Run with --force to re-apply")
+        return
+
     print("Starting Omarchy customization...")
     print("=" * 50)
     print("NOTE: This script follows Omarchy best practices by ONLY modifying")
@@ -1431,7 +2171,7 @@ def main():
     print("=" * 50)
 
     # Check for yay at the beginning - required for package management
-    if not shutil.which("yay"):
+    if not have("yay"):
         print("! ERROR: yay package manager not found")
         print("! yay is required for package installation and removal")
         print("! Please install yay first: https://github.com/Jguer/yay")
@@ -1441,108 +2181,134 @@ def main():
         remove_packages()
         print()
 
-
         manage_font_packages()
         print()
 
         # install_toshy()  # Commented out - using keyd instead
-        install_and_configure_keyd()
-        print()
-
-        remove_user_config_directories()
+        keyd_plan = prepare_keyd(args.overwrite_keyd)
         print()
 
-        remove_broken_mise_shims()
-        print()
-
-        remove_system_asdcontrol()
-        print()
-
-        manage_user_desktop_files()
-        print()
-
-        chrome_wayland_ok = configure_chrome_wayland()
+        packages_ok = apply_package_changes()
         print()
 
-        create_nautilus_vscode_script()
+        keyd_ok = install_and_configure_keyd(keyd_plan)
         print()
 
-        remove_webapps_from_user_space()
-        print()
-
-        create_webapps()
-        print()
-
-        bash_ok = customize_bash_config()
+        remove_user_config_directories()
         print()
 
-        hyprland_ok = update_user_hyprland_config()
+        remove_broken_mise_shims()
         print()
 
-        terminal_paste_ok = customize_terminal_paste()
+        # May prompt for a sudo password, so not inside a concurrent group
+        remove_system_asdcontrol()
         print()
 
-        ghostty_mac_keys_ok = customize_ghostty_mac_keys()
-        print()
+        # Independent of each other and of the file edits below; they mostly
+        # wait on xdg/git/webapp helpers, so let those waits overlap
+        _, _, default_browser_ok = run_concurrently(
+            spaced(remove_webapps_from_user_space),
+            spaced(reset_git_config),
+            spaced(set_default_browser),
+        )
 
-        mako_ghostty_ok = customize_mako_ghostty_persistent()
-        print()
+        # Each writes its own files (distinct .desktop entries, the Nautilus
+        # script); overlap the rest with the webapp icon downloads
+        _, chrome_wayland_ok, _, _ = run_concurrently(
+            spaced(manage_user_desktop_files),
+            spaced(configure_chrome_wayland),
+            spaced(create_nautilus_vscode_script),
+            spaced(functools.partial(create_webapps, refresh_icons=args.force)),
+        )
 
         # update_user_hypridle_config()  # Commented out - user prefers original hypridle config
-        # print()
-
-        reset_git_config()
-        print()
-
-        default_browser_ok = set_default_browser()
-        print()
-
-        desktop_db_ok = update_desktop_database()
-        print()
 
-        waybar_ok = customize_waybar()
-        print()
+        # Each edits its own config files (the desktop database only needs
+        # the .desktop entries written above). Both terminal steps edit
+        # Ghostty's config, so they run in order within one step
+        def customize_terminals():
+            terminal_paste_ok = customize_terminal_paste()
+            print()
+            return terminal_paste_ok, customize_ghostty_mac_keys()
+
+        (
+            bash_ok,
+            hyprland_ok,
+            (terminal_paste_ok, ghostty_mac_keys_ok),
+            mako_ghostty_ok,
+            desktop_db_ok,
+            waybar_ok,
+        ) = run_concurrently(
+            spaced(customize_bash_config),
+            spaced(update_user_hyprland_config),
+            spaced(customize_terminals),
+            spaced(customize_mako_ghostty_persistent),
+            spaced(update_desktop_database),
+            spaced(customize_waybar),
+        )
 
-        print("Restarting Waybar...")
-        run_command("killall waybar")
-        # Launch via Hyprland so the new waybar is a child of the compositor,
-        # not the script's bash -c shell (which would SIGHUP it on exit).
-        run_command("hyprctl dispatch exec -- uwsm-app -- waybar")
-        print("✓ Waybar restarted")
+        print("Reloading Waybar...")
+        # SIGUSR2 makes a running Waybar reload its config and style in place,
+        # without the bar disappearing while a new one starts
+        if run_command(["pkill", "-USR2", "-x", "waybar"], quiet=True):
+            print("✓ Waybar reloaded")
+        else:
+            # Not running: launch via Hyprland so waybar is a child of the
+            # compositor, not of this script (which would SIGHUP it on exit).
+            run_command(
+                ["hyprctl", "dispatch", "exec", "--", "uwsm-app", "--", "waybar"],
+                quiet=True,
+            )
+            print("✓ Waybar started")
         print()
 
         print("=" * 50)
-        print("✓ Customization complete!")
-        print("✓ Removed dev/editor/misc apps where present (neovim, dropbox, Zoom, Obsidian, Signal, 1Password, LocalSend)")
-        print("✓ Switched from Chromium to Google Chrome")
-        print("✓ Updated font packages (removed CJK/extra fonts, added Hebrew support)")
-        print("✓ keyd setup step executed (install or reuse existing configuration)")
-        if hyprland_ok:
-            print("✓ Set Chrome environment variables and window rules in Hyprland")
-        if bash_ok:
-            print("✓ Added Bash improvements and completion")
-        print("✓ Disabled Apple display brightness controls")
-        print("✓ Reset git configuration")
-        print("✓ Installed Joplin and set Super+Shift+J keybinding")
-        print("✓ Bound Ctrl+Shift+C to upstream Walker clipboard manager")
-        if waybar_ok:
-            print("✓ Configured Waybar language display for Hebrew/English layouts")
-        if terminal_paste_ok:
-            print("✓ Mac-style Ctrl+V paste & selection auto-copy in Alacritty/Ghostty")
-        if ghostty_mac_keys_ok:
-            print("✓ Mac-style tabs/splits in Ghostty (Ctrl+T/W/D, Ctrl+Shift+D)")
-        if mako_ghostty_ok:
-            print("✓ Ghostty notifications persist until dismissed (mako)")
-        if chrome_wayland_ok:
-            print("✓ Google Chrome forced to native Wayland (respects HiDPI scale)")
-        print("✓ Removed broken mise-dependent shims from ~/.local/bin/")
-        print("✓ Created Nautilus script for opening files in VS Code/Cursor")
-        if default_browser_ok:
-            print("✓ Set default browser handlers to google-chrome.desktop")
-        if desktop_db_ok:
-            print("✓ Updated desktop database")
-        print("✓ All changes made to USER configuration files only")
-        print("✓ Internal Omarchy files preserved for upgrade compatibility")
+        # Assembled up front and written in one go rather than line by line
+        summary = (
+            (True, "✓ Customization complete!"),
+            (True, "✓ Removed dev/editor/misc apps where present (neovim, dropbox, Zoom, Obsidian, Signal, 1Password, LocalSend)"),
+            (True, "✓ Switched from Chromium to Google Chrome"),
+            (True, "✓ Updated font packages (removed CJK/extra fonts, added Hebrew support)"),
+            (True, "✓ keyd setup step executed (install or reuse existing configuration)"),
+            (hyprland_ok, "✓ Set Chrome environment variables and window rules in Hyprland"),
+            (bash_ok, "✓ Added Bash improvements and completion"),
+            (True, "✓ Disabled Apple display brightness controls"),
+            (True, "✓ Reset git configuration"),
+            (True, "✓ Installed Joplin and set Super+Shift+J keybinding"),
+            (True, "✓ Bound Ctrl+Shift+C to upstream Walker clipboard manager"),
+            (waybar_ok, "✓ Configured Waybar language display for Hebrew/English layouts"),
+            (terminal_paste_ok, "✓ Mac-style Ctrl+V paste & selection auto-copy in Alacritty/Ghostty"),
+            (ghostty_mac_keys_ok, "✓ Mac-style tabs/splits in Ghostty (Ctrl+T/W/D, Ctrl+Shift+D)"),
+            (mako_ghostty_ok, "✓ Ghostty notifications persist until dismissed (mako)"),
+            (chrome_wayland_ok, "✓ Google Chrome forced to native Wayland (respects HiDPI scale)"),
+            (True, "✓ Removed broken mise-dependent shims from ~/.local/bin/"),
+            (True, "✓ Created Nautilus script for opening files in VS Code/Cursor"),
+            (default_browser_ok, "✓ Set default browser handlers to google-chrome.desktop"),
+            (desktop_db_ok, "✓ Updated desktop database"),
+            (True, "✓ All changes made to USER configuration files only"),
+            (True, "✓ Internal Omarchy files preserved for upgrade compatibility"),
+        )
+        print("\n".join(line for ok, line in summary if ok))
+
+        if all(
+            (
+                packages_ok,
+                keyd_ok,
+                chrome_wayland_ok,
+                bash_ok,
+                hyprland_ok,
+                terminal_paste_ok,
+                ghostty_mac_keys_ok,
+                mako_ghostty_ok,
+                default_browser_ok,
+                desktop_db_ok,
+                waybar_ok,
+            )
+        ):
+            ensure_dir(STATE_FILE.parent)
+            STATE_FILE.write_text(state + "\n")
+        else:
+            print("- Some steps did not complete; the next run will retry them")
 
     except KeyboardInterrupt:
         print("\n! Customization interrupted by user")
@@ -5,10 +5,29 @@ Simple restore script for Omarchy customizations
 This script only restores .original backup files created by customize.py
 """
 
-import shutil
+import concurrent.futures
+import os
 import sys
 from pathlib import Path
 
+from customize import BACKUP_DIRS, STATE_FILE, TOSHY_STAMP_FILE
+
+
+def copy_file(src, dst):
+    """Copy a file's contents, mode and timestamps, moving the data in-kernel"""
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        st = os.fstat(src_file.fileno())
+        offset = 0
+        while offset < st.st_size:
+            sent = os.sendfile(
+                dst_file.fileno(), src_file.fileno(), offset, st.st_size - offset
+            )
+            if sent == 0:
+                break
+            offset += sent
+        os.fchmod(dst_file.fileno(), st.st_mode & 0o7777)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
 
 def restore_file_from_backup(file_path):
     """Restore a file from its .original backup"""
@@ -20,7 +39,7 @@ def restore_file_from_backup(file_path):
         return False
 
     try:
-        shutil.copy2(backup_path, file_path)
+        copy_file(backup_path, file_path)
         print(f"✓ Restored {file_path} from backup")
         return True
     except Exception as e:
@@ -28,6 +47,42 @@ def restore_file_from_backup(file_path):
         return False
 
 
+def walk_backups(root):
+    """Yield every .original file under root, reusing readdir's entry types"""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".original"):
+                    yield Path(entry.path)
+
+
+def has_backups(directory):
+    """Whether directory directly contains a .original file"""
+    try:
+        with os.scandir(directory) as entries:
+            return any(entry.name.endswith(".original") for entry in entries)
+    except OSError:
+        return False
+
+
+def restore_backup(backup_path):
+    """Copy a .original backup over its file, returning (restored, message)"""
+    original_path = backup_path.with_suffix("")
+
+    try:
+        copy_file(backup_path, original_path)
+        return True, f"✓ Restored {original_path} from {backup_path}"
+    except Exception as e:
+        return False, f"! Failed to restore {original_path}: {e}"
+
+
 def find_and_restore_backups():
     """Find all .original backup files and restore them"""
     print("Searching for backup files...")
@@ -35,8 +90,14 @@ def find_and_restore_backups():
     home = Path.home()
     restored_count = 0
 
+    # customize.py only creates backups directly inside BACKUP_DIRS; if none
+    # holds one it never ran, so skip walking the whole config tree
+    if not any(has_backups(directory) for directory in BACKUP_DIRS):
+        print("- No backup files found to restore")
+        return
+
     # Common locations where backups might be created
-    search_paths = [
+    search_paths = {
         home / ".bashrc.original",
         home / ".config/hypr/hyprland.conf.original",
         home / ".config/hypr/hypridle.conf.original",
@@ -44,32 +105,26 @@ def find_and_restore_backups():
         home / ".config/waybar/style.css.original",
         home / ".config/toshy/toshy_config.py.original",
         Path("/etc/keyd/default.conf.original"),
-    ]
+    }
 
     # Also search recursively in common config directories
     config_dirs = [home / ".config", home / ".local/share"]
 
     for config_dir in config_dirs:
-        if config_dir.exists():
-            for backup_file in config_dir.rglob("*.original"):
-                search_paths.append(backup_file)
-
-    # Remove duplicates
-    search_paths = list(set(search_paths))
-
-    for backup_path in search_paths:
-        if backup_path.exists():
-            original_path = backup_path.with_suffix("")
-            if original_path.suffix == ".original":
-                # Handle cases where the backup has double extension
-                original_path = backup_path.parent / backup_path.stem
-
-            try:
-                shutil.copy2(backup_path, original_path)
-                print(f"✓ Restored {original_path} from {backup_path}")
-                restored_count += 1
-            except Exception as e:
-                print(f"! Failed to restore {original_path}: {e}")
+        search_paths.update(walk_backups(config_dir))
+
+    # The fixed locations may not exist; sort for a stable report order
+    existing_backups = sorted(path for path in search_paths if path.exists())
+
+    # Each copy touches only its own file, so overlap their I/O and report
+    # in order afterwards
+    if existing_backups:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(32, len(existing_backups))
+        ) as executor:
+            for restored, message in executor.map(restore_backup, existing_backups):
+                print(message)
+                restored_count += restored
 
     if restored_count == 0:
         print("- No backup files found to restore")
@@ -77,6 +132,18 @@ def find_and_restore_backups():
         print(f"✓ Restored {restored_count} files from backups")
 
 
+def clear_customization_state():
+    """Forget customize.py's completed run so it re-applies after a restore"""
+    for state_file in (STATE_FILE, TOSHY_STAMP_FILE):
+        try:
+            state_file.unlink()
+            print(f"✓ Removed {state_file}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"! Failed to remove {state_file}: {e}")
+
+
 def main():
     """Main restoration function"""
     print("Restoring files from .original backups...")
@@ -84,6 +151,7 @@ def main():
 
     try:
         find_and_restore_backups()
+        clear_customization_state()
         print("=" * 40)
         print("✓ Backup restoration complete!")
 